@@ -6,99 +6,293 @@ Rules:
 - The page contains multiple accordions. We ONLY parse the FIRST accordion (Kongen).
 - Years are derived from the links inside the accordion content (text/title/href).
 - Links can be absolute or relative.
+- Fast path: a regex over the raw index bytes picks the newest Kongens-tale link;
+  the accordion parsing is only used if the regex finds nothing.
 - Writes taler/<YEAR>.md only if it doesn't already exist.
+- The index page is cached in taler/.cache/ and revalidated with ETag/Last-Modified.
 
 Deps:
 - requests
 - beautifulsoup4
+- lxml (valgfri; falder tilbage til html.parser)
+- selectolax (valgfri; bruges til talesiden, ellers lxml eller beautifulsoup4)
 """
 
 from __future__ import annotations
 
+import io
 import re
 import sys
-from datetime import datetime
+import time
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
 from urllib.parse import urljoin
 
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from bs4 import BeautifulSoup, FeatureNotFound, SoupStrainer
+
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:
+    LexborHTMLParser = None
+
+try:
+    from lxml import etree
+    from lxml import html as lxml_html
+except ImportError:
+    etree = lxml_html = None
 
 
 INDEX_URL = "https://www.kongehuset.dk/monarkiet-i-danmark/nytaarstaler/"
 BASE_URL = "https://www.kongehuset.dk"
+# URL-mønster for talesiden, fx /nyheder/laes-h-m-kongens-nytaarstale-2025
+SPEECH_URL_TEMPLATE = BASE_URL + "/nyheder/laes-h-m-kongens-nytaarstale-{year}"
+
+OUT_DIR = Path("taler")
+CACHE_DIR = OUT_DIR / ".cache"
 
 YEAR_RE = re.compile(r"\b(19|20)\d{2}\b")
+# Links til kongens taler, fx href="/nyheder/laes-h-m-kongens-nytaarstale-2025"
+SPEECH_LINK_RE = re.compile(
+    rb'href="((?:https://www\.kongehuset\.dk)?/nyheder/laes-[^"]*kongens-nytaarstale-((?:19|20)\d{2})/?)"'
+)
+
+
+def has_accordion_class(value) -> bool:
+    # Under parsing ser SoupStrainer hele class-strengen, ikke de enkelte klasser.
+    if not value:
+        return False
+    tokens = value.split() if isinstance(value, str) else value
+    return "accordion" in tokens
+
+
+# Indekssiden bygges kun for .accordion-divs; resten af siden springes over.
+ACCORDION_STRAINER = SoupStrainer("div", class_=has_accordion_class)
+
+if etree is not None:
+    # Uden <meta charset> falder libxml2 tilbage til Latin-1; siden er UTF-8.
+    LXML_HTML_PARSER = lxml_html.HTMLParser(encoding="utf-8")
+    H1_XPATH = etree.XPath("(//h1)[1]")
+    MAIN_XPATH = etree.XPath("(//main)[1]")
+    P_XPATH = etree.XPath(".//p")
+    ACCORDION_LINKS_XPATH = etree.XPath(
+        ".//*[contains(concat(' ', normalize-space(@class), ' '), ' accordion__container__item__content ')]"
+        "//a[@href]"
+    )
 
 
-def get_html(url: str) -> str:
-    r = requests.get(
-        url,
-        timeout=30,
-        headers={
-            "User-Agent": "kongens-nytaarstaler-bot/1.0 (+https://github.com/tykfyr/kongens-nytaarstaler)"
-        },
-    )
+# Index og taleside ligger på samme host; sessionen genbruger forbindelsen.
+SESSION = requests.Session()
+SESSION.headers.update(
+    {
+        "User-Agent": "kongens-nytaarstaler-bot/1.0 (+https://github.com/tykfyr/kongens-nytaarstaler)"
+    }
+)
+SESSION.mount("https://", HTTPAdapter(pool_connections=2, pool_maxsize=4))
+
+
+def get_bytes(url: str, cache_key: str | None = None) -> bytes:
+    if cache_key is None:
+        r = SESSION.get(url, timeout=30)
+        r.raise_for_status()
+        return r.content
+
+    body_file = CACHE_DIR / f"{cache_key}.html"
+    etag_file = CACHE_DIR / f"{cache_key}.etag"
+    lastmod_file = CACHE_DIR / f"{cache_key}.lastmod"
+
+    headers = {}
+    if body_file.exists():
+        if etag_file.exists():
+            headers["If-None-Match"] = etag_file.read_text(encoding="utf-8")
+        if lastmod_file.exists():
+            headers["If-Modified-Since"] = lastmod_file.read_text(encoding="utf-8")
+
+    r = SESSION.get(url, timeout=30, headers=headers)
+    if r.status_code == 304:
+        return body_file.read_bytes()
     r.raise_for_status()
-    return r.text
+
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    body_file.write_bytes(r.content)
+    for f, value in ((etag_file, r.headers.get("ETag")), (lastmod_file, r.headers.get("Last-Modified"))):
+        if value:
+            f.write_text(value, encoding="utf-8")
+        elif f.exists():
+            f.unlink()
+    return r.content
+
+
+def get_speculative_bytes(url: str) -> bytes | None:
+    # Kun et direkte 200 tæller; redirects og soft-404 må ikke blive gemt som årets tale.
+    r = SESSION.get(url, timeout=30, allow_redirects=False)
+    if r.status_code != 200:
+        return None
+    return r.content
+
+
+def make_soup(content: bytes, parse_only: SoupStrainer | None = None) -> BeautifulSoup:
+    # Kongehuset serverer UTF-8; eksplicit encoding springer gætteriet over.
+    try:
+        return BeautifulSoup(content, "lxml", from_encoding="utf-8", parse_only=parse_only)
+    except FeatureNotFound:
+        return BeautifulSoup(content, "html.parser", from_encoding="utf-8", parse_only=parse_only)
 
 
 def get_first_accordion(soup: BeautifulSoup):
-    accordions = soup.select("div.accordion")
-    if not accordions:
+    accordion = soup.find("div", class_="accordion")
+    if accordion is None:
         raise RuntimeError("Fandt ingen .accordion på siden.")
-    return accordions[0]
+    return accordion
+
+
+def lxml_text(el) -> str:
+    # Samme resultat som get_text(" ", strip=True): hver tekstnode strippes i kanterne.
+    return " ".join(t.strip() for t in el.itertext() if t.strip())
+
 
+# Samme href optræder ofte to gange (billede- og titellink), så resultatet memoiseres.
+@lru_cache(maxsize=256)
+def extract_year_from_link(txt: str, title: str, href: str) -> int | None:
+    # Én søgning i stedet for tre; NUL-separatoren forhindrer match hen over felterne,
+    # og første match følger stadig prioriteten tekst, title, href.
+    m = YEAR_RE.search(f"{txt}\x00{title}\x00{href}")
+    return int(m.group(0)) if m else None
 
-def extract_year_from_link(a) -> int | None:
-    txt = (a.get_text(" ", strip=True) or "")
-    title = (a.get("title") or "")
-    href = (a.get("href") or "")
 
-    for s in (txt, title, href):
-        m = YEAR_RE.search(s)
-        if m:
-            return int(m.group(0))
-    return None
+def absolute_url(href: str) -> str:
+    if href.startswith("http"):
+        return href
+    if href.startswith("/") and not href.startswith("//"):
+        return BASE_URL + href
+    return urljoin(BASE_URL + "/", href)
 
 
-def find_latest_speech_url(index_html: str) -> tuple[int, str]:
-    soup = BeautifulSoup(index_html, "html.parser")
+def first_accordion_links_lxml(index_content: bytes) -> list[tuple[str, str, str]]:
+    # Stream-parse og stop ved første </div> med klassen "accordion"; resten af siden
+    # tokeniseres aldrig.
+    context = etree.iterparse(
+        io.BytesIO(index_content), events=("end",), tag="div", html=True, encoding="utf-8"
+    )
+    for _, el in context:
+        if "accordion" not in (el.get("class") or "").split():
+            continue
+        links = [
+            (lxml_text(a), a.get("title") or "", a.get("href") or "")
+            for a in ACCORDION_LINKS_XPATH(el)
+        ]
+        el.clear()
+        return links
+    raise RuntimeError("Fandt ingen .accordion på siden.")
+
+
+def first_accordion_links_bs4(index_content: bytes) -> list[tuple[str, str, str]]:
+    soup = make_soup(index_content, parse_only=ACCORDION_STRAINER)
     root = get_first_accordion(soup)
+    return [
+        (a.get_text(" ", strip=True) or "", a.get("title") or "", a.get("href") or "")
+        for a in root.select(".accordion__container__item__content a[href]")
+    ]
+
+
+def find_latest_speech_url_regex(index_content: bytes) -> tuple[int, str] | None:
+    matches = SPEECH_LINK_RE.findall(index_content)
+    if not matches:
+        return None
+    year, href = max(((int(y), h.decode("utf-8")) for h, y in matches), key=lambda x: x[0])
+    return year, absolute_url(href)
+
+
+def find_latest_speech_url(index_content: bytes) -> tuple[int, str]:
+    found = find_latest_speech_url_regex(index_content)
+    if found is not None:
+        return found
+
+    # Markup har ændret sig; fald tilbage til at parse første accordion.
+    if etree is not None:
+        links = first_accordion_links_lxml(index_content)
+    else:
+        links = first_accordion_links_bs4(index_content)
 
-    links = root.select(".accordion__container__item__content a[href]")
     if not links:
         raise RuntimeError("Fandt ingen links i første accordion.")
 
-    candidates: list[tuple[int, str]] = []
-    for a in links:
-        year = extract_year_from_link(a)
+    best_year, best_url = -1, ""
+    for txt, title, href in links:
+        year = extract_year_from_link(txt, title, href)
         if not year:
             continue
 
-        href = (a.get("href") or "").strip()
+        href = href.strip()
         if not href:
             continue
 
-        url = href if href.startswith("http") else urljoin(BASE_URL, href)
-        candidates.append((year, url))
+        if year > best_year:
+            best_year, best_url = year, absolute_url(href)
 
-    if not candidates:
+    if not best_url:
         raise RuntimeError("Fandt ingen årstal i links i første accordion (Kongen).")
 
-    candidates.sort(key=lambda x: x[0], reverse=True)
-    return candidates[0]
+    return best_year, best_url
+
+
+def lexbor_text(node) -> str:
+    # Som lxml_text; text(strip=True) efterlader separatorer for tomme tekstnoder.
+    texts = (n.text_content for n in node.traverse(include_text=True) if n.tag == "-text")
+    return " ".join(t.strip() for t in texts if t and t.strip())
+
+
+def extract_title_and_paragraphs_lexbor(content: bytes) -> tuple[str, Iterator[str]]:
+    tree = LexborHTMLParser(content)
+
+    h1 = tree.css_first("h1")
+    title = lexbor_text(h1) if h1 else ""
+    title = title or "Kongens nytårstale"
 
+    main = tree.css_first("main") or tree.body or tree.root
+    paragraphs = (lexbor_text(p) for p in main.css("p"))
+    return title, paragraphs
 
-def extract_title_and_text(html: str) -> tuple[str, str]:
-    soup = BeautifulSoup(html, "html.parser")
+
+def extract_title_and_paragraphs_lxml(content: bytes) -> tuple[str, Iterator[str]]:
+    try:
+        tree = lxml_html.fromstring(content, parser=LXML_HTML_PARSER)
+    except etree.ParserError as e:
+        raise RuntimeError(f"Kunne ikke parse talesiden: {e}") from e
+
+    h1 = H1_XPATH(tree)
+    title = lxml_text(h1[0]) if h1 else ""
+    title = title or "Kongens nytårstale"
+
+    main = MAIN_XPATH(tree)
+    root = main[0] if main else tree
+    paragraphs = (lxml_text(p) for p in P_XPATH(root))
+    return title, paragraphs
+
+
+def extract_title_and_paragraphs_bs4(content: bytes) -> tuple[str, Iterator[str]]:
+    soup = make_soup(content)
 
     h1 = soup.find("h1")
     title = h1.get_text(" ", strip=True) if h1 else "Kongens nytårstale"
 
     main = soup.find("main") or soup
-    paragraphs = [p.get_text(" ", strip=True) for p in main.find_all("p")]
-    text = "\n\n".join([p for p in paragraphs if p])
+    paragraphs = (p.get_text(" ", strip=True) for p in main.find_all("p"))
+    return title, paragraphs
+
+
+def extract_title_and_text(content: bytes) -> tuple[str, str]:
+    if LexborHTMLParser is not None:
+        title, paragraphs = extract_title_and_paragraphs_lexbor(content)
+    elif lxml_html is not None:
+        title, paragraphs = extract_title_and_paragraphs_lxml(content)
+    else:
+        title, paragraphs = extract_title_and_paragraphs_bs4(content)
+
+    text = "\n\n".join(filter(None, paragraphs))
 
     if len(text) < 500:
         raise RuntimeError("Udtræk gav meget lidt tekst (markup kan have ændret sig).")
@@ -107,14 +301,13 @@ def extract_title_and_text(html: str) -> tuple[str, str]:
 
 
 def write_markdown(year: int, title: str, source_url: str, text: str) -> Path:
-    out_dir = Path("taler")
-    out_dir.mkdir(parents=True, exist_ok=True)
+    OUT_DIR.mkdir(parents=True, exist_ok=True)
 
-    out_file = out_dir / f"{year}.md"
+    out_file = OUT_DIR / f"{year}.md"
     if out_file.exists():
         return out_file
 
-    fetched = datetime.now().strftime("%Y-%m-%d")
+    fetched = time.strftime("%Y-%m-%d")
     md = f"""# {title}
 
 Kilde: {source_url}
@@ -124,29 +317,73 @@ Hentet: {fetched}
 
 {text}
 """
-    out_file.write_text(md, encoding="utf-8")
+    out_file.write_bytes(md.encode("utf-8"))
     return out_file
 
 
 def main() -> int:
-    index_html = get_html(INDEX_URL)
+    try:
+        return run()
+    finally:
+        SESSION.close()
 
-    year, speech_url = find_latest_speech_url(index_html)
-    out_file = Path("taler") / f"{year}.md"
 
-    if out_file.exists():
-        print(f"OK: {out_file} findes allerede. Ingen ændringer.")
-        return 0
+def try_speculative_speech(future, year: int) -> tuple[str, str] | None:
+    try:
+        content = future.result()
+        if content is None:
+            return None
+        title, text = extract_title_and_text(content)
+    except (requests.RequestException, RuntimeError):
+        return None
+
+    if str(year) not in title:
+        return None
+    return title, text
 
-    speech_html = get_html(speech_url)
-    title, text = extract_title_and_text(speech_html)
 
+def write_and_report(year: int, title: str, speech_url: str, text: str) -> int:
     written = write_markdown(year, title, speech_url, text)
     print(f"Skrev: {written}")
     print(f"URL: {speech_url}")
     return 0
 
 
+def run() -> int:
+    # Talen for et år holdes 31/12 samme år; findes filen, er der intet nyere at hente.
+    current_year = time.localtime().tm_year
+    current_file = OUT_DIR / f"{current_year}.md"
+    if current_file.exists():
+        print(f"OK: {current_file} findes allerede. Ingen ændringer.")
+        return 0
+
+    # Hent indekset og gæt samtidig på årets taleside ud fra det kendte URL-mønster.
+    # Lykkes gættet, spares turen indeks -> taleside; ellers bruges indekset som før.
+    guess_url = SPEECH_URL_TEMPLATE.format(year=current_year)
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        index_future = pool.submit(get_bytes, INDEX_URL, "index")
+        guess_future = pool.submit(get_speculative_bytes, guess_url)
+
+        guessed = try_speculative_speech(guess_future, current_year)
+        if guessed is not None:
+            title, text = guessed
+            return write_and_report(current_year, title, guess_url, text)
+
+        index_content = index_future.result()
+
+    year, speech_url = find_latest_speech_url(index_content)
+    out_file = OUT_DIR / f"{year}.md"
+
+    if out_file.exists():
+        print(f"OK: {out_file} findes allerede. Ingen ændringer.")
+        return 0
+
+    speech_content = get_bytes(speech_url)
+    title, text = extract_title_and_text(speech_content)
+
+    return write_and_report(year, title, speech_url, text)
+
+
 if __name__ == "__main__":
     try:
         raise SystemExit(main())